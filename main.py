@@ -1,63 +1,362 @@
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.staticfiles import StaticFiles
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from webauthn import (
-    options_to_json,
     generate_registration_options,
     generate_authentication_options,
     verify_registration_response,
     verify_authentication_response,
 )
+from webauthn.helpers.exceptions import WebAuthnException
 from webauthn.helpers.structs import (
     PublicKeyCredentialDescriptor,
     AuthenticatorTransport,
 )
+from pydantic import BaseModel, TypeAdapter, ValidationError
 
-from webauthn.helpers import options_to_json_dict
-import secrets
+from webauthn.helpers import (
+    options_to_json_dict,
+    decode_credential_public_key,
+    decoded_public_key_to_cryptography,
+)
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import functools
+import importlib
+import os
+import threading
 import time
-import json
 import base64
+import hashlib
+import mimetypes
+import redis.asyncio
+
+# challenges only live this long (seconds), after that the flow has to start over
+CHALLENGE_TTL = 60
+# how often (seconds) the background task throws away expired challenges
+CHALLENGE_SWEEP_INTERVAL = 30
+
+
+async def sweep_expired_challenges():
+    # clients that start a flow and never finish would otherwise leave their challenge behind forever
+    # (only needed for the in memory store, redis expires the keys itself)
+    while True:
+        await asyncio.sleep(CHALLENGE_SWEEP_INTERVAL)
+        challenges.prune_expired()
+
+
+# the login_time we hand out only has second resolution, so one task updates it once a second
+# instead of every login calling time.time() itself
+current_second = int(time.time())
+
+
+async def tick_current_second():
+    global current_second
+    while True:
+        current_second = int(time.time())
+        await asyncio.sleep(1)
 
-app = FastAPI()
+
+# the webauthn verify calls are cpu bound, they run in these worker processes so the event loop stays free
+executor: ProcessPoolExecutor | None = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global executor
+    # check the py_webauthn internals once here, so startup fails instead of every worker later on
+    _public_key_cache_target()
+    executor = ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_install_public_key_cache)
+    ticker = asyncio.create_task(tick_current_second())
+    sweeper = None
+    if isinstance(challenges, MemoryChallengeStore):
+        sweeper = asyncio.create_task(sweep_expired_challenges())
+    yield
+    ticker.cancel()
+    if sweeper is not None:
+        sweeper.cancel()
+    await challenges.close()
+    executor.shutdown(cancel_futures=True)
+
+
+# orjson does the response serialization instead of the stdlib json module,
+# the webauthn options are big nested dicts with long base64url strings so this matters
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# gzip the responses, the base64url strings in the options compress really well
+# tiny responses like {"status": "registered"} stay below minimum_size and are sent as is
+app.add_middleware(GZipMiddleware, minimum_size=512)
 
 # Add CORS middleware, this is for DEV only and allows https://localhost:8000 to work with 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:8000"],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # only what the test interface actually sends, and let the browser cache the preflight for a day
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type"],
+    max_age=86400,
 )
 
+class ShardedDict:
+    """Dict split over a fixed number of shards, each guarded by its own lock.
+
+    Readers and writers for different keys mostly land on different shards,
+    so they don't wait on each other like they would with one global lock.
+    """
+
+    SHARDS = 16  # must be a power of two, we mask the hash with SHARDS - 1
+
+    def __init__(self):
+        self.shards = [{} for _ in range(self.SHARDS)]
+        self.locks = [threading.Lock() for _ in range(self.SHARDS)]
+
+    def _s(self, key) -> int:
+        return hash(key) & (self.SHARDS - 1)
+
+    def __contains__(self, key) -> bool:
+        shard = self._s(key)
+        with self.locks[shard]:
+            return key in self.shards[shard]
+
+    def __getitem__(self, key):
+        shard = self._s(key)
+        with self.locks[shard]:
+            return self.shards[shard][key]
+
+    def __setitem__(self, key, value):
+        shard = self._s(key)
+        with self.locks[shard]:
+            self.shards[shard][key] = value
+
+    def __delitem__(self, key):
+        shard = self._s(key)
+        with self.locks[shard]:
+            del self.shards[shard][key]
+
+    def get(self, key, default=None):
+        shard = self._s(key)
+        with self.locks[shard]:
+            return self.shards[shard].get(key, default)
+
+    def pop(self, key, default=None):
+        shard = self._s(key)
+        with self.locks[shard]:
+            return self.shards[shard].pop(key, default)
+
+    def prune(self, should_remove):
+        # drop every entry whose value matches, one shard at a time so we never hold all locks
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                for key in [key for key, value in shard.items() if should_remove(value)]:
+                    del shard[key]
+
+
+class _RandPool:
+    """Hands out os.urandom bytes from a buffer that is refilled 4 KiB at a time."""
+
+    SIZE = 4096
+
+    def __init__(self):
+        self._reset()
+        # a forked child must never hand out the same bytes as its parent
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.buf = bytearray()
+        self.lock = threading.Lock()
+
+    def take(self, n: int) -> bytes:
+        with self.lock:
+            if len(self.buf) < n:
+                self.buf = bytearray(os.urandom(max(self.SIZE, n)))
+            out = bytes(self.buf[:n])
+            del self.buf[:n]
+            return out
+
+
+_RANDPOOL = _RandPool()
+
+
+## the challenge stores, both hand out a challenge only once: pop() fetches and deletes it in one go
+# so a challenge can never be used twice, not even by two requests at the same time
+
+class MemoryChallengeStore:
+    """Challenges in this process only, fine for a single worker."""
+
+    def __init__(self):
+        # {email: (challenge, expires_at)}
+        self.challenges = ShardedDict()
+
+    async def set(self, email: str, challenge: bytes):
+        self.challenges[email] = (challenge, time.monotonic() + CHALLENGE_TTL)
+
+    async def pop(self, email: str) -> bytes | None:
+        entry = self.challenges.pop(email)
+        if not entry or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def prune_expired(self):
+        now = time.monotonic()
+        self.challenges.prune(lambda entry: entry[1] < now)
+
+    async def close(self):
+        pass
+
+
+class RedisChallengeStore:
+    """Challenges in redis, shared by every worker and kept over a restart."""
+
+    def __init__(self, url: str):
+        # redis-py picks the hiredis parser automatically when it is installed
+        self.redis = redis.asyncio.Redis.from_url(url, decode_responses=False)
+
+    async def set(self, email: str, challenge: bytes):
+        # redis expires the key for us, no sweeping needed
+        await self.redis.set(f"chal:{email}", challenge, ex=CHALLENGE_TTL)
+
+    async def pop(self, email: str) -> bytes | None:
+        return await self.redis.getdel(f"chal:{email}")
+
+    async def close(self):
+        await self.redis.aclose()
+
+
 ## demo databases in memory only , for prod use a database
-users = {} 
-challenges = {} ## for example use redis here
+users = ShardedDict()
+# set REDIS_URL (for example redis://localhost:6379/0) to keep the challenges in redis
+challenges = RedisChallengeStore(os.environ["REDIS_URL"]) if os.getenv("REDIS_URL") else MemoryChallengeStore()
 
 RP_ID = "localhost"
 ORIGIN = "http://localhost:8000" 
 
+
+## request bodies, pydantic-core parses the raw json bytes and validates them in one pass
+# (instead of FastAPI's stdlib json.loads followed by a second validation pass over the dict)
+# the credential stays a plain dict, py_webauthn parses that itself
+class RegisterVerifyBody(BaseModel):
+    Email: str
+    credential: dict
+
+
+class LoginVerifyBody(BaseModel):
+    email: str
+    credential: dict
+
+
+REGISTER_VERIFY_BODY = TypeAdapter(RegisterVerifyBody)
+LOGIN_VERIFY_BODY = TypeAdapter(LoginVerifyBody)
+LOGIN_VERIFY_BATCH_BODY = TypeAdapter(list[LoginVerifyBody])
+
+
+async def parse_body(request: Request, adapter: TypeAdapter):
+    try:
+        return adapter.validate_json(await request.body())
+    except ValidationError as error:
+        # same 422 response FastAPI gives for a body parameter that doesn't validate
+        raise RequestValidationError(
+            [{**detail, "loc": ("body", *detail["loc"])} for detail in error.errors(include_url=False)]
+        )
+
+
+def body_schema(schema: dict) -> dict:
+    # the body isn't a parameter anymore, so tell the /docs page what it looks like
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": schema}}}}
+
+
+## parsed public keys, memoized per worker process
+# verify_authentication_response gets the raw COSE bytes of the device on every login and parses them
+# into a cryptography.io key object every single time. py_webauthn has no way to pass in an already parsed key,
+# and key objects can't be pickled over to the pool anyway, so every worker keeps its own cache and
+# _install_public_key_cache() points py_webauthn's verify module at the cached versions of its two parse helpers
+
+@functools.lru_cache(maxsize=1024)
+def _parse_public_key(public_key: bytes):
+    decoded_public_key = decode_credential_public_key(public_key)
+    # keep the cryptography key on the decoded key, that is the only thing the second helper gets passed
+    decoded_public_key.crypto_public_key = decoded_public_key_to_cryptography(decoded_public_key)
+    return decoded_public_key
+
+
+def _cached_public_key_to_cryptography(decoded_public_key):
+    return getattr(decoded_public_key, "crypto_public_key", None) or decoded_public_key_to_cryptography(decoded_public_key)
+
+
+def _public_key_cache_target():
+    # the patch depends on py_webauthn internals, if a new version moves or renames the helpers
+    # we want to know right away instead of silently running without the cache
+    verify_module = importlib.import_module("webauthn.authentication.verify_authentication_response")
+    for name in ("decode_credential_public_key", "decoded_public_key_to_cryptography"):
+        if not hasattr(verify_module, name):
+            raise RuntimeError(f"py_webauthn has no {verify_module.__name__}.{name}, the public key cache needs updating")
+    return verify_module
+
+
+def _install_public_key_cache():
+    # runs once in every process pool worker (ProcessPoolExecutor initializer)
+    verify_module = _public_key_cache_target()
+    verify_module.decode_credential_public_key = _parse_public_key
+    verify_module.decoded_public_key_to_cryptography = _cached_public_key_to_cryptography
+
+
+def _do_register_verify(credential: dict, challenge: bytes, rp_id: str, origin: str) -> tuple[bytes, bytes, int]:
+    # runs in the process pool, so it only takes and returns plain picklable values
+    verification = verify_registration_response(
+        credential=credential,
+        expected_challenge=challenge,
+        expected_rp_id=rp_id,
+        expected_origin=origin,
+    )
+    return verification.credential_id, verification.credential_public_key, verification.sign_count
+
+
+def _do_auth_verify(credential: dict, challenge: bytes, rp_id: str, origin: str, public_key: bytes, counter: int) -> int:
+    # runs in the process pool as well, returns the new sign count of the device
+    verification = verify_authentication_response(
+        credential=credential,
+        expected_challenge=challenge,
+        expected_rp_id=rp_id,
+        expected_origin=origin,
+        credential_public_key=public_key,
+        credential_current_sign_count=counter,
+    )
+    return verification.new_sign_count
+
+
+def credential_descriptors(user: dict) -> list[PublicKeyCredentialDescriptor]:
+    # the descriptor list only changes when a device is registered, so we build it once
+    # and keep it on the user record until finish_register clears it again
+    if user["allow_credentials_cache"] is None:
+        user["allow_credentials_cache"] = [
+            PublicKeyCredentialDescriptor(
+                id=credential["id"],
+                transports=[AuthenticatorTransport.INTERNAL]
+            ) for credential in user["credentials"].values()
+        ]
+    return user["allow_credentials_cache"]
+
 ########################################################
 ### step 1 registration 
 
 
 @app.get("/webauthn/register/options")
-def begin_register(email: str):
+async def begin_register(email: str):
     # Check if user already exists, if not create new user
     if email not in users:
-        user_id = secrets.token_bytes(16)
-        users[email] = {"id": user_id, "credentials": []}
+        user_id = _RANDPOOL.take(16)
+        # credentials are keyed by credential id so login can find the device directly
+        users[email] = {"id": user_id, "credentials": {}, "allow_credentials_cache": None}
         exclude_credentials = []
     else:
         # Use existing user_id for additional devices
         user_id = users[email]["id"]
         # Exclude existing credentials to prevent duplicate device registrations
-        exclude_credentials = [
-            PublicKeyCredentialDescriptor(
-                id=base64.urlsafe_b64decode(credential["id"] + '=' * (4 - len(credential["id"]) % 4)),
-                transports=[AuthenticatorTransport.INTERNAL]
-            ) for credential in users[email]["credentials"]
-        ]
+        exclude_credentials = credential_descriptors(users[email])
     
     registration_options = generate_registration_options(
         rp_name= "MyWebauthnAPP",
@@ -69,77 +368,75 @@ def begin_register(email: str):
         exclude_credentials=exclude_credentials
     )
 
-    # we save the challenge in our in memory database , we use the challange to prevent replay attacks from outside the orign browser sesion 
-    challenges[email] =  registration_options.challenge
+    # we save the challenge in our challenge store, we use the challange to prevent replay attacks from outside the orign browser sesion 
+    # it expires after CHALLENGE_TTL seconds
+    await challenges.set(email, registration_options.challenge)
 
-    # now we return it as a json object using a 2-step conversion:
-    # 1. options_to_json() converts WebAuthn object (with bytes) to JSON string (with base64url)
-    # 2. json.loads() converts JSON string back to Python dict for FastAPI serialization
-    # this ensures proper base64url encoding while keeping FastAPI happy
-    #return json.loads(options_to_json(registration_options))
-
-    ## this seem to be a better sollution lets try this 
+    # now we return it as a json object, options_to_json_dict() gives us a dict with the bytes already base64url encoded
+    # and orjson dumps that straight away, no options_to_json() string that gets json.loads()-ed again
     return options_to_json_dict(registration_options)
 
 
 ################
 ### step 2 complete the registration
 
-@app.post("/webauthn/register/verify")
+@app.post("/webauthn/register/verify", openapi_extra=body_schema(RegisterVerifyBody.model_json_schema()))
 async def finish_register(request: Request):
-    ## get the request and make it a json
-    body = await request.json()
-    # get email from the json 
-    email = body["Email"]
-    # get the challange from the in memory challenges , if there is no challenge get a error (the process must have started)
-    registration_challenge = challenges.get(email)
+    body = await parse_body(request, REGISTER_VERIFY_BODY)
+    # get email from the body 
+    email = body.Email
+    # the user record is made by begin_register, check it first: with redis a challenge can outlive the
+    # in memory users table (restart, or the options request went to another worker)
+    user = users.get(email)
+    if not user:
+        raise HTTPException(400,f"No registration in process for {email}")
+    # get the challange from the challenge store , if there is no challenge get a error (the process must have started)
+    # pop also removes it, so we dont need to delete it anymore after the registration
+    registration_challenge = await challenges.pop(email)
     if not registration_challenge:
         raise HTTPException(400,f"No registration in process for {email}")
 
     ## now check the request from the device, again we use the body from above 
-    registration_verification = verify_registration_response(
-        credential = body["credential"],
-        expected_challenge=registration_challenge,
-        expected_rp_id = RP_ID,
-        expected_origin= ORIGIN
-    )
+    # py_webauthn raises a WebAuthnException for a bad challenge, broken attestation, unsupported key, ...
+    # and a plain ValueError/TypeError for some malformed input (non cbor attestation, non utf-8 client data)
+    try:
+        credential_id, public_key, sign_count = await asyncio.get_running_loop().run_in_executor(
+            executor, _do_register_verify, body.credential, registration_challenge, RP_ID, ORIGIN
+        )
+    except (WebAuthnException, ValueError, TypeError):
+        raise HTTPException(400, f"There was a issue with registering {email}")
 
     ### now we store the device credential 
     device_credential = {
-        ## webauthn doesnt add = as padding to the string if needed causing errors, so we strip away any right side padding if present
-        # unsure if this is a dirty fix or just normal ?
-        "id": base64.urlsafe_b64encode(registration_verification.credential_id).decode().rstrip('='),
-        "public_key": registration_verification.credential_public_key,
+        # we keep the raw bytes, they only get base64url encoded when the options are sent to the browser
+        "id": credential_id,
+        "public_key": public_key,
         # we also use a counter to prevent replay attacks 
-        "counter": registration_verification.sign_count
+        "counter": sign_count
     }
 
     ## here we store it in the user table 
-    users[email]["credentials"].append(device_credential)
-    # and we dont need the challenges anymore so we can delete it
-    del challenges[email]
+    user["credentials"][device_credential["id"]] = device_credential
+    # the new device has to show up in the descriptor list, so rebuild it on the next request
+    user["allow_credentials_cache"] = None
 
     #finaly we respond with a status registered so the browser knows we did it !
-    return {"status": "registered"}
+    # returning a response object directly skips FastAPI's jsonable_encoder pass over the dict
+    return ORJSONResponse({"status": "registered"})
 
 
 ########################################
 ## now we can start the login process 
 
 @app.get("/webauthn/login/options")
-def begin_login(email: str):
+async def begin_login(email: str):
     # first we check if the users is already registered in the database and has at least 1 device in their table
     user = users.get(email)
     if not user or not user["credentials"]:
         raise HTTPException(404, f"there is a issue login in with {email}")
     
     # then we check if the credentials match ! we loop through user[credentials] and append to the publickeycredentialdescriptor
-    allow_credentials = [
-        PublicKeyCredentialDescriptor(
-            id=base64.urlsafe_b64decode(credential["id"] + '=' * (4 - len(credential["id"]) % 4)),
-            transports=[AuthenticatorTransport.INTERNAL]
-        ) for credential in user["credentials"]
-    ]
+    allow_credentials = credential_descriptors(user)
     
     ## we fill the authenticiaton_options with the RP ID the correct item foudn in the credentials user list
     authentication_options = generate_authentication_options(
@@ -148,21 +445,37 @@ def begin_login(email: str):
     )
 
     # we add the challlenge to the challenges again to prevent replay attkcs
-    challenges[email] = authentication_options.challenge
+    await challenges.set(email, authentication_options.challenge)
     ## return the json of the authentication options to the browser
-    #return json.loads(options_to_json(authentication_options))
     return options_to_json_dict(authentication_options)
 
 
 ############
 ## now we can verify the login
-@app.post("/webauthn/login/verify")
-async def finish_login(request: Request):
-    ## we do the same thing as above, get the body and details from the body
-    body = await request.json()
-    email = body["email"]
-    
-    # and get the user again from the user db
+
+# one lock per email, kept in least recently used order so the dict can't grow forever
+EMAIL_LOCKS_MAX = 10_000
+email_locks: OrderedDict[str, asyncio.Lock] = OrderedDict()
+
+
+def email_lock(email: str) -> asyncio.Lock:
+    lock = email_locks.get(email)
+    if lock is None:
+        lock = email_locks[email] = asyncio.Lock()
+    email_locks.move_to_end(email)
+    # throw away the oldest locks, but never one that is still in use
+    while len(email_locks) > EMAIL_LOCKS_MAX:
+        oldest_email, oldest_lock = next(iter(email_locks.items()))
+        if oldest_lock.locked():
+            break
+        del email_locks[oldest_email]
+    return lock
+
+
+async def verify_login(email: str, credential: dict) -> dict:
+    # shared by the single and the batch verify endpoint, raises a HTTPException when the login is not valid
+
+    # get the user again from the user db
     user = users.get(email)
 
     # check to make sure the user exists
@@ -170,59 +483,156 @@ async def finish_login(request: Request):
         raise HTTPException(400, f"There was a issue with login {email}")
 
 
-    # lets check the challenge to prevent relay attacks
-    authentication_challenge = challenges.get(email)    
+    # lets check the challenge to prevent relay attacks, pop removes it right away so it can only be used once
+    authentication_challenge = await challenges.pop(email)
     if not authentication_challenge:
         raise HTTPException(400, f"There was a issue with login {email}")
 
     ## now we can start login with the existing credential
-    # store the credential id from the body (already base64url string)
-    credential_id = body["credential"]["id"]
+    # the credential id from the body is a base64url string without padding, decode it once to the raw bytes we store
+    try:
+        credential_id = credential["id"]
+        credential_id = base64.urlsafe_b64decode(credential_id + "=" * (-len(credential_id) % 4))
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(400, f"There was a issue with login {email}")
 
     ## find the credential id in the user object from above
-    used_device_credential = None
-    for credential in user["credentials"]:
-        if credential["id"] == credential_id:
-            used_device_credential = credential 
-            break
+    used_device_credential = user["credentials"].get(credential_id)
 
     # if no valid credential is found the ask to register again 
     if used_device_credential is None:
         raise HTTPException(401, "no credential registered, please register this device" )
 
     ## next we verify the signature
-    verification = verify_authentication_response(
-        credential=body["credential"],
-        expected_challenge=authentication_challenge,
-        expected_rp_id=RP_ID,
-        expected_origin=ORIGIN,
-        credential_public_key=used_device_credential["public_key"],
-        credential_current_sign_count=used_device_credential["counter"],
-    )
-
-    # Update de counter van dit device, this will stop replay attacks 
-    used_device_credential["counter"] = verification.new_sign_count
-
-    # after succes then the challenge is no longer needed 
-    del challenges[email]
+    # the counter is read, checked in the worker and written back, two logins for the same email at the same time
+    # would both see the old counter, so they take turns
+    async with email_lock(email):
+        try:
+            new_sign_count = await asyncio.get_running_loop().run_in_executor(
+                executor,
+                _do_auth_verify,
+                credential,
+                authentication_challenge,
+                RP_ID,
+                ORIGIN,
+                used_device_credential["public_key"],
+                used_device_credential["counter"],
+            )
+        except (WebAuthnException, ValueError, TypeError):
+            # not just a bad signature, also broken json/cbor in the credential or an unsupported key,
+            # some of that malformed input makes py_webauthn raise a plain ValueError/TypeError (UnicodeDecodeError is a ValueError)
+            raise HTTPException(401, f"There was a issue with login {email}")
+
+        # Update de counter van dit device, this will stop replay attacks 
+        used_device_credential["counter"] = new_sign_count
 
     # return a successful device login 
     return {
         "status": "ok",
         "user": email,
-        "login_time": int(time.time())
+        "login_time": current_second
     }
 
 
-# Mount static files AFTER all API routes to avoid conflicts
-app.mount("/", StaticFiles(directory="static", html=True), name="static")
+@app.post("/webauthn/login/verify", openapi_extra=body_schema(LoginVerifyBody.model_json_schema()))
+async def finish_login(request: Request):
+    body = await parse_body(request, LOGIN_VERIFY_BODY)
+    ## we do the same thing as above, get the details from the body
+    return ORJSONResponse(await verify_login(body.email, body.credential))
+
+
+############
+## verify a whole list of logins in one request, for example for a re-auth sweep
+@app.post(
+    "/webauthn/login/verify_batch",
+    openapi_extra=body_schema({"type": "array", "items": LoginVerifyBody.model_json_schema()}),
+)
+async def finish_login_batch(request: Request):
+    items = await parse_body(request, LOGIN_VERIFY_BATCH_BODY)
+    # the body is a list of {"email": ..., "credential": ...} items, every item needs its own login challenge
+
+    # one failing login should not fail the rest, so every item gets its own result in the same order
+    async def verify_item(item: LoginVerifyBody) -> dict:
+        try:
+            return await verify_login(item.email, item.credential)
+        except HTTPException as error:
+            return {"status": "error", "user": item.email, "detail": error.detail}
+
+    # gather them so the verifications run side by side in the process pool
+    # return_exceptions so an unexpected error in one item can't throw away the results of the others,
+    # their challenges are already used up by then
+    results = await asyncio.gather(*(verify_item(item) for item in items), return_exceptions=True)
+    results = [
+        {"status": "error", "user": item.email, "detail": "login could not be verified"} if isinstance(result, Exception) else result
+        for item, result in zip(items, results)
+    ]
+    return ORJSONResponse({"results": results})
+
+
+########################################
+## static files for the test interface
+
+def load_static_files(directory: str) -> dict[str, tuple[bytes, str, str]]:
+    # read the whole directory into memory once, {url path: (content, etag, content type)}
+    # a missing or empty directory fails right at startup, just like StaticFiles did
+    if not os.path.isdir(directory):
+        raise RuntimeError(f"Directory '{directory}' does not exist")
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                content = f.read()
+            url_path = os.path.relpath(path, directory).replace(os.sep, "/")
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            files[url_path] = (content, f'"{hashlib.sha1(content).hexdigest()}"', content_type)
+    if not files:
+        raise RuntimeError(f"Directory '{directory}' has no files to serve")
+    return files
+
+
+# resolved next to this file, so it works no matter which directory the app is started from
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+static_files = load_static_files(STATIC_DIR)
+
+
+# this catch all route is registered AFTER all API routes so it can never shadow them
+@app.api_route("/{full_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_static(full_path: str, request: Request):
+    # just like StaticFiles(html=True) a directory serves its index.html
+    if full_path == "" or full_path.endswith("/"):
+        full_path += "index.html"
+    static_file = static_files.get(full_path)
+    if static_file is None:
+        raise HTTPException(404, "Not Found")
+    content, etag, content_type = static_file
+
+    # no-cache means the browser keeps the file but checks the etag with us before using it,
+    # so a changed file still shows up right away and an unchanged one costs a 304 without a body
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content, media_type=content_type, headers=headers)
 
 # lets run fastapi 
+# DEV=1 python main.py gives auto-reload, without it there is no file watcher and WORKERS worker processes
 if __name__ == "__main__":
+    import sys
     import uvicorn
+    dev = os.getenv("DEV") == "1"
     uvicorn.run(
         "main:app",      # "filename:app_instance"
         host="localhost",
         port=8000,
-        reload=True     # auto-reload when code changes
-    )
\ No newline at end of file
+        reload=dev,     # auto-reload when code changes, dev only
+        reload_includes=["static/*"] if dev else None,  # the static files are kept in memory, so reload when they change too
+        # pin the fast event loop and http parser, so a missing install fails loudly instead of
+        # silently falling back to asyncio + h11 (uvloop does not exist on windows)
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        # the users table is still in memory per process, so more than 1 worker only works
+        # once users live in a real database (and challenges in redis, see REDIS_URL)
+        workers=1 if dev else int(os.getenv("WORKERS", "1")),
+        log_level="warning"  # no access log line for every request
+    )